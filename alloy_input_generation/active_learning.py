@@ -0,0 +1,193 @@
+import os
+import re
+import csv
+import logging
+import numpy as np
+from alloy_combinations import elements
+from generate_alloy_concentrations import read_concentration_sets, save_concentration_sets_to_file
+
+# Result columns written by cal/emto-cpa.py after the per-alloy concentrations
+RESULT_COLUMNS = ['r_squared', 'sws0', 'lattice_constants', 'E0', 'C11', 'C12', 'C44',
+                  'B', 'G', 'E', 'v', 'AVR']
+DESCRIPTOR_PROPERTIES = ['atomic_number', 'density', 'melting_point']
+
+def read_results(filename):
+    """
+    Read the computed alloys from data.csv.
+    The header is written for the first alloy only, so the element symbols are
+    taken from the System column and the result columns are read from the end.
+    :param filename: Path to data.csv
+    :return: List of (combination, fractions, results) tuples
+    """
+    results = []
+    with open(filename, 'r', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if not row:
+                continue
+            combo = tuple(re.findall(r'[A-Z][a-z]?', row[0]))
+            concs = [float(c) for c in row[1:1 + len(combo)]]
+            values = row[-len(RESULT_COLUMNS):]
+            try:
+                values = {name: float(val) for name, val in zip(RESULT_COLUMNS, values)}
+            except ValueError:
+                logging.warning(f"Skipping malformed row for {row[0]}")
+                continue
+            total = sum(concs)
+            results.append((combo, [c / total for c in concs], values))
+    return results
+
+def composition_descriptors(combo, fractions, elements):
+    """
+    Build the descriptor vector of a composition from the elements table.
+    Contains the fraction of every element in the table followed by the
+    concentration-weighted mean and mismatch of each tabulated property.
+    :param combo: A combination of elements
+    :param fractions: Atomic fractions of the elements (sum to 1)
+    :param elements: Dictionary of elements
+    :return: 1D numpy array of descriptors
+    """
+    symbols = list(elements.keys())
+    x = np.zeros(len(symbols))
+    for elem, frac in zip(combo, fractions):
+        x[symbols.index(elem)] = frac
+    features = [x]
+    for property_name in DESCRIPTOR_PROPERTIES:
+        values = np.array([elements[elem][property_name] for elem in symbols], dtype=float)
+        mean = np.dot(x, values)
+        mismatch = np.sqrt(np.dot(x, (1 - values / mean) ** 2))
+        features.append([mean, mismatch])
+    return np.concatenate([np.ravel(f) for f in features])
+
+def fit_gaussian_process(X, y, noise=1e-2):
+    """
+    Fit a Gaussian process with a squared exponential kernel.
+    Features are standardised and the length scale is set to the median
+    pairwise distance of the training set.
+    :param X: Training descriptors, shape (n, d)
+    :param y: Training targets, shape (n,)
+    :param noise: Noise variance relative to the target variance
+    :return: Dictionary holding the fitted model
+    """
+    x_mean = X.mean(axis=0)
+    x_std = X.std(axis=0)
+    x_std[x_std == 0] = 1.0
+    Xs = (X - x_mean) / x_std
+    y_mean = y.mean()
+    y_std = y.std() if y.std() > 0 else 1.0
+    ys = (y - y_mean) / y_std
+
+    d2 = _squared_distances(Xs, Xs)
+    length_scale = np.sqrt(np.median(d2[d2 > 0])) if np.any(d2 > 0) else 1.0
+    K = np.exp(-0.5 * d2 / length_scale ** 2) + noise * np.eye(len(Xs))
+    L = np.linalg.cholesky(K)
+    alpha = np.linalg.solve(L.T, np.linalg.solve(L, ys))
+    return {'X': Xs, 'x_mean': x_mean, 'x_std': x_std, 'y_mean': y_mean, 'y_std': y_std,
+            'length_scale': length_scale, 'L': L, 'alpha': alpha}
+
+def predict(model, X, batch_size=2048):
+    """
+    Predict the mean and standard deviation of the target for new compositions.
+    :param model: Model returned by fit_gaussian_process
+    :param X: Candidate descriptors, shape (m, d)
+    :param batch_size: Number of candidates evaluated at once
+    :return: Tuple of (mean, std) arrays
+    """
+    Xs = (X - model['x_mean']) / model['x_std']
+    mean = np.empty(len(Xs))
+    std = np.empty(len(Xs))
+    for start in range(0, len(Xs), batch_size):
+        block = Xs[start:start + batch_size]
+        Ks = np.exp(-0.5 * _squared_distances(block, model['X']) / model['length_scale'] ** 2)
+        v = np.linalg.solve(model['L'], Ks.T)
+        mean[start:start + batch_size] = Ks @ model['alpha']
+        std[start:start + batch_size] = np.sqrt(np.clip(1.0 - np.sum(v ** 2, axis=0), 0, None))
+    return mean * model['y_std'] + model['y_mean'], std * model['y_std']
+
+def _squared_distances(A, B):
+    d2 = np.sum(A ** 2, axis=1)[:, None] + np.sum(B ** 2, axis=1)[None, :] - 2 * A @ B.T
+    return np.clip(d2, 0, None)
+
+def select_candidates(mean, std, candidates, top_k, acquisition='ucb', kappa=2.0, max_per_combo=None):
+    """
+    Rank the candidates by an acquisition function and keep the best top_k.
+    :param mean: Predicted mean of each candidate
+    :param std: Predicted standard deviation of each candidate
+    :param candidates: List of (combination, concentrations) tuples
+    :param top_k: Number of compositions to submit this round
+    :param acquisition: 'ucb' (most promising) or 'uncertainty' (most informative)
+    :param kappa: Exploration weight for 'ucb'
+    :param max_per_combo: Maximum picks per combination, None for no limit
+    :return: List of selected candidate indices, best first
+    """
+    if acquisition == 'ucb':
+        score = mean + kappa * std
+    elif acquisition == 'uncertainty':
+        score = std
+    else:
+        raise ValueError(f"Unknown acquisition function: {acquisition}")
+
+    selected = []
+    per_combo = {}
+    for idx in np.argsort(-score):
+        combo = candidates[idx][0]
+        if max_per_combo is not None and per_combo.get(combo, 0) >= max_per_combo:
+            continue
+        selected.append(int(idx))
+        per_combo[combo] = per_combo.get(combo, 0) + 1
+        if len(selected) == top_k:
+            break
+    return selected
+
+def main():
+    # Active learning settings
+    results_file = 'data.csv'
+    candidates_file = 'alloy_concentrations.txt'
+    selection_file = 'alloy_concentrations_round.txt'
+    target = 'B'
+    acquisition = 'ucb'
+    top_k = 100
+    max_per_combo = 4
+
+    results = read_results(results_file)
+    if len(results) < 2:
+        print(f"Need at least two computed alloys in {results_file}, found {len(results)}.")
+        return
+    X = np.array([composition_descriptors(combo, fracs, elements) for combo, fracs, _ in results])
+    y = np.array([values[target] for _, _, values in results])
+    model = fit_gaussian_process(X, y)
+    logging.info(f"Fitted surrogate for {target} on {len(results)} alloys.")
+
+    # Skip candidates that have already been computed
+    computed = {(combo, tuple(np.round(fracs, 4))) for combo, fracs, _ in results}
+    candidates = []
+    for combo, concs in read_concentration_sets(candidates_file):
+        fracs = [c / sum(concs) for c in concs]
+        if (combo, tuple(np.round(fracs, 4))) not in computed:
+            candidates.append((combo, concs))
+    if not candidates:
+        print("All candidate compositions have already been computed.")
+        return
+
+    Xc = np.array([composition_descriptors(combo, [c / sum(concs) for c in concs], elements)
+                   for combo, concs in candidates])
+    mean, std = predict(model, Xc)
+    selected = select_candidates(mean, std, candidates, top_k, acquisition=acquisition,
+                                 max_per_combo=max_per_combo)
+    logging.info(f"Selected {len(selected)} of {len(candidates)} candidates by {acquisition}.")
+
+    # Group the selection by combination so the file keeps the usual layout
+    if os.path.exists(selection_file):
+        os.remove(selection_file)
+    grouped = {}
+    for idx in selected:
+        combo, concs = candidates[idx]
+        grouped.setdefault(combo, []).append(concs)
+    for combo, concentration_sets in grouped.items():
+        save_concentration_sets_to_file(combo, concentration_sets, selection_file)
+    print(f"{len(selected)} compositions selected for this round have been saved to {selection_file}")
+    print(f"Submit them with: python cal/hpc-cal.py {os.path.join('alloy_input_generation', selection_file)}")
+
+if __name__ == '__main__':
+    main()
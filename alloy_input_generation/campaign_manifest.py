@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import logging
+from alloy_combinations import generate_combinations, elements
+from composition_index import load_index, save_index, add_composition
+from generate_alloy_concentrations import generate_unique_concentrations, save_concentration_sets_to_file
+from active_learning import read_results
+
+# The manifest files are shared with the driver in cal/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'cal'))
+from campaign_files import (MANIFEST_FILE, PARAMETERS_FILE, campaign_params, params_hash, fractions_key,
+                            locked, load_manifest, save_manifest, read_concentration_sets)
+
+def register_params(params, filename=PARAMETERS_FILE):
+    """
+    Record a parameter set under its hash so the manifest stays readable.
+    :return: Hash of the parameter set
+    """
+    phash = params_hash(params)
+    registry = {}
+    if os.path.exists(filename):
+        with open(filename, 'r') as f:
+            registry = json.load(f)
+    if phash not in registry:
+        registry[phash] = params
+        with open(filename, 'w') as f:
+            json.dump(registry, f, indent=2, sort_keys=True)
+    return phash
+
+def bootstrap_manifest(concentrations_file, results_file, params, index):
+    """
+    Seed an empty manifest with the campaign that already exists.
+    Every set in the concentrations file is recorded under the given parameters,
+    as 'completed' if it is in data.csv and 'planned' otherwise.
+    :param concentrations_file: File written by generate_alloy_concentrations.py
+    :param results_file: Path to data.csv
+    :param params: Dictionary of calculation parameters
+    :param index: Composition index, updated with the existing sets
+    :return: List of manifest entries
+    """
+    phash = params_hash(params)
+    completed = set()
+    if os.path.exists(results_file):
+        completed = {fractions_key(combo, fracs) for combo, fracs, _ in read_results(results_file)}
+    entries = []
+    for combo, concs in read_concentration_sets(concentrations_file):
+        status = 'completed' if fractions_key(combo, concs) in completed else 'planned'
+        add_composition(index, combo, concs, status)
+        entries.append([tuple(combo), tuple(concs), phash, status])
+    return entries
+
+def plan_delta(entries, elements, combo_size, params, index, num_sets=36):
+    """
+    Compute the work that is not in the manifest yet.
+    Combinations already planned with the same parameters are skipped.
+    Combinations planned with other parameters reuse their concentration sets,
+    and only new combinations get new random concentration sets.
+    :param entries: Manifest entries
+    :param elements: Dictionary of elements
+    :param combo_size: Size of each combination
+    :param params: Dictionary of calculation parameters
+    :param index: Composition index used to avoid near-duplicates
+    :param num_sets: Number of concentration sets for a new combination
+    :return: List of new manifest entries
+    """
+    phash = params_hash(params)
+    planned = {combo for combo, concs, entry_hash, status in entries if entry_hash == phash}
+    known_concs = {}
+    for combo, concs, entry_hash, status in entries:
+        known_concs.setdefault(combo, {}).setdefault(entry_hash, []).append(concs)
+
+    delta = []
+    for combo in generate_combinations(elements, combo_size):
+        if combo in planned:
+            continue
+        if combo in known_concs:
+            # Same compositions as the first parameter set they were planned with
+            concentration_sets = next(iter(known_concs[combo].values()))
+        else:
+            concentration_sets = generate_unique_concentrations(combo, index, num_sets)
+        for concs in concentration_sets:
+            delta.append([combo, tuple(concs), phash, 'planned'])
+    return delta
+
+def main():
+    # User input for combination size
+    combo_size = 4
+
+    params = campaign_params()
+    concentrations_file = 'alloy_concentrations.txt'
+
+    with locked():
+        entries = load_manifest()
+        index = load_index()
+        register_params(params)
+        if not entries and os.path.exists(concentrations_file):
+            entries = bootstrap_manifest(concentrations_file, 'data.csv', params, index)
+            logging.info(f"Seeded the manifest with {len(entries)} existing calculations.")
+        delta = plan_delta(entries, elements, combo_size, params, index)
+        save_manifest(entries + delta)
+        save_index(index)
+    new_combos = sorted({entry[0] for entry in delta})
+    logging.info(f"Planned {len(delta)} new calculations for {len(new_combos)} combinations.")
+
+    # Only the new work is written for submission
+    delta_filename = 'alloy_concentrations_delta.txt'
+    if os.path.exists(delta_filename):
+        os.remove(delta_filename)
+    for combo in new_combos:
+        concentration_sets = [list(concs) for entry_combo, concs, _, _ in delta if entry_combo == combo]
+        save_concentration_sets_to_file(combo, concentration_sets, delta_filename)
+
+    print(f"{len(delta)} new calculations for {len(new_combos)} combinations have been saved to {delta_filename}")
+
+if __name__ == '__main__':
+    main()
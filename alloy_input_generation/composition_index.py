@@ -0,0 +1,141 @@
+import os
+import logging
+import numpy as np
+from alloy_combinations import elements
+
+# Two compositions are duplicates when no concentration differs by more than eps (atomic fraction)
+DEFAULT_EPS = 0.005
+INDEX_FILE = 'composition_index.npz'
+STATUSES = ['planned', 'completed']
+
+def new_index(elements, eps=DEFAULT_EPS):
+    """
+    Create an empty composition index.
+    Compositions are keyed by an element bitmask and a float32 vector of atomic
+    fractions. Each bitmask has a bucket holding the fractions of its elements
+    in one float32 array, so a lookup is one vectorised comparison per bucket.
+    :param elements: Dictionary of elements, sets the bit of each element
+    :param eps: Largest concentration difference of a duplicate, as atomic fraction
+    :return: Dictionary holding the index
+    """
+    return {'symbols': list(elements.keys()), 'eps': eps, 'masks': [], 'concs': [],
+            'status': [], 'buckets': {}}
+
+def composition_key(index, combo, concentrations):
+    """
+    Get the bitmask and normalised float32 fraction vector of a composition.
+    :param combo: A combination of elements
+    :param concentrations: Concentrations of the elements, in % or fractions
+    """
+    symbols = index['symbols']
+    mask = 0
+    vector = np.zeros(len(symbols), dtype=np.float32)
+    total = float(sum(concentrations))
+    for elem, conc in zip(combo, concentrations):
+        bit = symbols.index(elem)
+        mask |= 1 << bit
+        vector[bit] = conc / total
+    return mask, vector
+
+def _active_key(index, combo, concentrations):
+    """Bitmask and float32 fractions of the elements of a composition, in bit order."""
+    symbols = index['symbols']
+    total = float(sum(concentrations))
+    pairs = sorted((symbols.index(elem), conc / total) for elem, conc in zip(combo, concentrations))
+    mask = 0
+    for bit, _ in pairs:
+        mask |= 1 << bit
+    return mask, np.array([fraction for _, fraction in pairs], dtype=np.float32)
+
+def find_near(index, combo, concentrations):
+    """
+    Find a composition within eps of the given one.
+    :return: Position of the closest indexed composition, or None
+    """
+    mask, active = _active_key(index, combo, concentrations)
+    bucket = index['buckets'].get(mask)
+    if bucket is None:
+        return None
+    positions = bucket['positions']
+    dist = np.abs(bucket['concs'][:len(positions)] - active).max(axis=1)
+    best = int(dist.argmin())
+    if dist[best] > index['eps']:
+        return None
+    return positions[best]
+
+def add_composition(index, combo, concentrations, status='planned'):
+    """
+    Add a composition to the index unless a near-duplicate is already there.
+    :return: Tuple of (position, added)
+    """
+    if status not in STATUSES:
+        raise ValueError(f"Unknown status: {status}")
+    pos = find_near(index, combo, concentrations)
+    if pos is not None:
+        if status == 'completed':
+            index['status'][pos] = status
+        return pos, False
+    mask, vector = composition_key(index, combo, concentrations)
+    pos = len(index['masks'])
+    index['masks'].append(mask)
+    index['concs'].append(vector)
+    index['status'].append(status)
+
+    # Grow the bucket array by doubling, so adding stays amortised O(1)
+    active = np.array([vector[bit] for bit in range(len(vector)) if mask >> bit & 1], dtype=np.float32)
+    bucket = index['buckets'].setdefault(mask, {'positions': [], 'concs': np.empty((0, len(active)), np.float32)})
+    n = len(bucket['positions'])
+    if n == len(bucket['concs']):
+        grown = np.empty((max(8, 2 * n), len(active)), dtype=np.float32)
+        grown[:n] = bucket['concs'][:n]
+        bucket['concs'] = grown
+    bucket['concs'][n] = active
+    bucket['positions'].append(pos)
+    return pos, True
+
+def save_index(index, filename=INDEX_FILE):
+    """Save the index to a numpy .npz file."""
+    n = len(index['masks'])
+    np.savez_compressed(filename,
+                        symbols=np.array(index['symbols']),
+                        eps=np.array(index['eps']),
+                        masks=np.array(index['masks'], dtype=np.uint64),
+                        concs=np.array(index['concs'], dtype=np.float32).reshape(n, len(index['symbols'])),
+                        status=np.array([STATUSES.index(s) for s in index['status']], dtype=np.uint8))
+
+def load_index(filename=INDEX_FILE, elements=elements, eps=None):
+    """
+    Load the index saved by a previous campaign, or create an empty one.
+    Stored compositions are remapped onto the current elements table, so
+    elements can be added between campaigns.
+    :param eps: Duplicate threshold, None to use the one saved with the index
+    """
+    if not os.path.exists(filename):
+        return new_index(elements, DEFAULT_EPS if eps is None else eps)
+    data = np.load(filename)
+    if eps is None:
+        eps = float(data['eps'])
+    index = new_index(elements, eps)
+    stored_symbols = [str(s) for s in data['symbols']]
+    for mask, concs, status in zip(data['masks'], data['concs'], data['status']):
+        combo = [stored_symbols[bit] for bit in range(len(stored_symbols)) if int(mask) >> bit & 1]
+        if any(elem not in index['symbols'] for elem in combo):
+            continue
+        fractions = [concs[stored_symbols.index(elem)] for elem in combo]
+        add_composition(index, combo, fractions, STATUSES[status])
+    logging.info(f"Loaded {len(index['masks'])} compositions from {filename}.")
+    return index
+
+def main():
+    # Mark the alloys already computed in data.csv as completed
+    from active_learning import read_results
+    index = load_index()
+    results = read_results('data.csv')
+    for combo, fractions, _ in results:
+        add_composition(index, combo, fractions, status='completed')
+    save_index(index)
+    completed = index['status'].count('completed')
+    print(f"{len(index['masks'])} compositions indexed, {completed} completed, saved to {INDEX_FILE}")
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,13 @@
 import os
+import sys
 import random
 import logging
 from alloy_combinations import generate_combinations, save_combinations_to_file, elements
+from composition_index import load_index, save_index, add_composition, INDEX_FILE
+
+# The reader of the concentration file is shared with cal/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'cal'))
+from campaign_files import read_concentration_sets
 
 # Initialize logging
 logging.basicConfig(filename='alloy_concentrations.log', level=logging.INFO, 
@@ -37,6 +43,28 @@ def save_concentration_sets_to_file(combo, concentration_sets, filename):
             file.write(", ".join(f"{elem}: {conc}%" for elem, conc in zip(combo, concentrations)) + "\n")
         file.write("\n")
 
+def generate_unique_concentrations(combo, index, num_sets=36, max_attempts=10):
+    """
+    Generate random concentration sets, skipping near-duplicates of compositions
+    already planned or computed in the composition index.
+    :param combo: A combination of elements
+    :param index: Composition index, updated with the new sets
+    :param num_sets: Number of concentration sets to generate
+    :param max_attempts: Number of draws of num_sets before giving up
+    :return: List of concentration sets
+    """
+    concentration_sets = []
+    for _ in range(max_attempts):
+        for concentrations in generate_random_concentrations(combo, num_sets - len(concentration_sets)):
+            pos, added = add_composition(index, combo, concentrations)
+            if added:
+                concentration_sets.append(concentrations)
+        if len(concentration_sets) == num_sets:
+            break
+    if len(concentration_sets) < num_sets:
+        logging.warning(f"Only {len(concentration_sets)} new concentration sets found for {', '.join(combo)}.")
+    return concentration_sets
+
 def main():
     # User input for combination size
     combo_size = 4
@@ -46,10 +74,14 @@ def main():
     logging.info(f"Generated {len(combinations_list)} combinations.")
     
     # Generate and save random concentration sets for each combination
+    # Compositions within eps of an earlier campaign are not generated again
     concentration_filename = 'alloy_concentrations.txt'
+    index = load_index()
     for combo in combinations_list:
-        concentration_sets = generate_random_concentrations(combo)
+        concentration_sets = generate_unique_concentrations(combo, index)
         save_concentration_sets_to_file(combo, concentration_sets, concentration_filename)
+    save_index(index)
+    logging.info(f"Composition index with {len(index['masks'])} entries saved to {INDEX_FILE}.")
     print(f"Random concentration sets for each combination have been saved to {concentration_filename}")
 
 if __name__ == '__main__':
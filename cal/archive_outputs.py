@@ -0,0 +1,118 @@
+import os
+import sys
+import fnmatch
+import zipfile
+
+# EMTO working directories of an alloy, also present under ela/
+STAGE_DIRS = ['kgrn', 'kfcd', 'shape', 'kstr', 'bmdl']
+ARCHIVE_NAME = 'emto_outputs.zip'
+
+# Files kept loose: potentials for warm starts and the analysed results
+KEEP_PATTERNS = ['kgrn/*.pot', 'ela/kgrn/*.pot', 'lattice_constants.txt', 'ela/elastic_constants.txt']
+
+
+def collect_outputs(alloy_dir):
+    """Return the paths, relative to alloy_dir, of all files in the stage directories."""
+    outputs = []
+    for top in ['.', 'ela']:
+        for stage in STAGE_DIRS:
+            stage_dir = os.path.join(alloy_dir, top, stage)
+            if not os.path.isdir(stage_dir):
+                continue
+            for root, _, names in os.walk(stage_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    outputs.append(os.path.relpath(path, alloy_dir))
+    return sorted(outputs)
+
+
+def is_kept(relpath):
+    """Check if a file has to stay loose after archiving."""
+    return any(fnmatch.fnmatch(relpath, pattern) for pattern in KEEP_PATTERNS)
+
+
+def archive_alloy(alloy_dir, prune=True):
+    """
+    Stream the outputs of a finished alloy into one compressed zip archive.
+    Every member is compressed separately and listed in the zip central
+    directory, so single files can be read back without unpacking the rest.
+    Files matching KEEP_PATTERNS are not archived and stay loose.
+    Loose copies are only removed once the archive has been written and verified.
+    :param alloy_dir: Folder of the alloy calculation
+    :param prune: Remove archived files and empty stage directories
+    :return: Path to the archive
+    """
+    archive = os.path.join(alloy_dir, ARCHIVE_NAME)
+    outputs = collect_outputs(alloy_dir)
+    if not outputs:
+        print(f"No outputs to archive in {alloy_dir}.")
+        return archive
+
+    # Loose files are newer than their archived copies, so the archive is rebuilt
+    # from them plus the members that are no longer loose. Kept files stay out.
+    current = {relpath.replace(os.sep, '/'): relpath for relpath in outputs if not is_kept(relpath)}
+    tmp_archive = archive + '.tmp'
+    with zipfile.ZipFile(tmp_archive, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        if os.path.exists(archive):
+            with zipfile.ZipFile(archive, 'r') as old:
+                for info in old.infolist():
+                    if info.filename not in current and not is_kept(info.filename):
+                        zf.writestr(info, old.read(info.filename))
+        for name, relpath in current.items():
+            zf.write(os.path.join(alloy_dir, relpath), arcname=name)
+    with zipfile.ZipFile(tmp_archive, 'r') as zf:
+        bad_file = zf.testzip()
+    if bad_file is not None:
+        os.remove(tmp_archive)
+        raise RuntimeError(f"Archive check failed for {bad_file} in {alloy_dir}.")
+    os.replace(tmp_archive, archive)
+    print(f"{len(current)} files archived in {archive}")
+
+    if prune:
+        for relpath in outputs:
+            if not is_kept(relpath):
+                os.remove(os.path.join(alloy_dir, relpath))
+        for top in ['.', 'ela']:
+            for stage in STAGE_DIRS:
+                _remove_empty_dirs(os.path.join(alloy_dir, top, stage))
+    return archive
+
+
+def _remove_empty_dirs(folder):
+    if not os.path.isdir(folder):
+        return
+    for root, _, _ in os.walk(folder, topdown=False):
+        if not os.listdir(root):
+            os.rmdir(root)
+
+
+def list_archive(archive, pattern='*'):
+    """List the members of an archive matching a glob pattern."""
+    with zipfile.ZipFile(archive, 'r') as zf:
+        return [name for name in zf.namelist() if fnmatch.fnmatch(name, pattern)]
+
+
+def extract_file(archive, member, dest_folder='.'):
+    """
+    Extract one member of an archive, e.g. 'ela/kfcd/TiVNbTa_d1_0.01_3.050000.prn'.
+    :return: Path of the extracted file
+    """
+    with zipfile.ZipFile(archive, 'r') as zf:
+        return zf.extract(member, path=dest_folder)
+
+
+def read_file(archive, member):
+    """Read one member of an archive as text without writing it to disk."""
+    with zipfile.ZipFile(archive, 'r') as zf:
+        return zf.read(member).decode()
+
+
+def main():
+    # Archive every alloy folder given on the command line
+    alloy_dirs = sys.argv[1:] or [os.getcwd()]
+    for alloy_dir in alloy_dirs:
+        archive_alloy(os.path.abspath(alloy_dir))
+
+
+if __name__ == '__main__':
+    main()
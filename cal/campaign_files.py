@@ -0,0 +1,136 @@
+# Readers and writers of the campaign files shared by alloy_input_generation/ and cal/.
+# Only the standard library and emto_parameters are imported, so both trees can
+# use it without pulling in each other's modules.
+import os
+import csv
+import json
+import fcntl
+import hashlib
+import contextlib
+import emto_parameters
+
+MANIFEST_FILE = 'campaign_manifest.csv'
+PARAMETERS_FILE = 'campaign_parameters.json'
+MANIFEST_HEADERS = ['combination', 'concentrations', 'params', 'status']
+
+
+def read_concentration_sets(filename):
+    """
+    Read the concentration sets written by save_concentration_sets_to_file.
+    :param filename: Name of the file
+    :return: List of (combination, concentrations) tuples, concentrations in %
+    """
+    entries = []
+    combo = None
+    with open(filename, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith("Combination: "):
+                combo = tuple(line.split(": ", 1)[1].split(", "))
+            elif line and combo is not None:
+                pairs = [item.split(": ") for item in line.split(", ")]
+                entries.append((combo, [float(conc.rstrip('%')) for elem, conc in pairs]))
+    return entries
+
+
+def campaign_params():
+    """
+    Get the settings that change the results of a calculation.
+    Read from emto_parameters.py, which the driver emto-cpa.py also uses.
+    :return: Dictionary of calculation parameters
+    """
+    return {'primitive': emto_parameters.primitive,
+            'xc': emto_parameters.xc,
+            'method': emto_parameters.method,
+            'deltas': [float(d) for d in emto_parameters.deltas],
+            'distortions': list(emto_parameters.distortions),
+            'lattice_kmesh': list(emto_parameters.LATTICE_KMESH),
+            'elastic_kmesh': {k: list(v) for k, v in emto_parameters.ELASTIC_KMESH.items()},
+            'lattice': emto_parameters.LATTICE_PARAMS,
+            'elastic': emto_parameters.ELASTIC_PARAMS}
+
+
+def params_hash(params):
+    """
+    Get a short identifier of a parameter set.
+    :param params: Dictionary of calculation parameters
+    :return: First 12 hex digits of the SHA-1 of the sorted parameters
+    """
+    text = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+def fractions_key(combo, concs):
+    """Key of a composition that compares equal for % and fractions."""
+    total = sum(concs)
+    return tuple(combo), tuple(round(c / total, 4) for c in concs)
+
+
+@contextlib.contextmanager
+def locked(filename=MANIFEST_FILE):
+    """Hold an exclusive lock on the manifest while it is read and rewritten."""
+    with open(filename + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def load_manifest(filename=MANIFEST_FILE):
+    """
+    Load the campaign manifest.
+    :param filename: Path of the manifest file
+    :return: List of entries (combination, concentrations, params hash, status)
+    """
+    if not os.path.exists(filename):
+        return []
+    entries = []
+    with open(filename, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            combo = tuple(row['combination'].split(', '))
+            concs = tuple(float(c) for c in row['concentrations'].split(', '))
+            entries.append([combo, concs, row['params'], row['status']])
+    return entries
+
+
+def save_manifest(entries, filename=MANIFEST_FILE):
+    """
+    Save the campaign manifest.
+    :param entries: List of entries (combination, concentrations, params hash, status)
+    :param filename: Path of the manifest file
+    """
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(MANIFEST_HEADERS)
+        for combo, concs, phash, status in entries:
+            writer.writerow([", ".join(combo), ", ".join(str(c) for c in concs), phash, status])
+
+
+def update_status(entries, combo, concs, params, status):
+    """
+    Set the status of a manifest entry, e.g. 'submitted', 'completed' or 'failed'.
+    :return: True if the entry was found
+    """
+    phash = params_hash(params)
+    key = fractions_key(combo, concs)
+    for entry in entries:
+        if entry[2] == phash and fractions_key(entry[0], entry[1]) == key:
+            entry[3] = status
+            return True
+    return False
+
+
+def set_status(combo, concs, status, filename):
+    """
+    Update the status of one calculation in the manifest file under the current
+    parameters. Called by emto-cpa.py; several drivers may run at once.
+    :param concs: Concentrations of the elements, in % or fractions
+    :param filename: Path of the manifest file in the campaign folder
+    :return: True if the entry was found
+    """
+    if not os.path.exists(filename):
+        return False
+    with locked(filename):
+        entries = load_manifest(filename)
+        found = update_status(entries, combo, concs, campaign_params(), status)
+        if found:
+            save_manifest(entries, filename)
+    return found
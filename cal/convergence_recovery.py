@@ -0,0 +1,177 @@
+import os
+import re
+import json
+from slurm_planner import extend_walltime
+
+# Escalating overrides of the KGRN input, one step per resubmission.
+# STRT=B restarts from the potential of the failed run (warm start).
+RECOVERY_LADDER = [
+    {'strt': 'B', 'amix': 0.005, 'niter': 300},
+    {'strt': 'B', 'amix': 0.005, 'ncpa': 30, 'alpcpa': 0.6, 'niter': 300},
+    {'strt': 'B', 'amix': 0.002, 'ncpa': 40, 'alpcpa': 0.5, 'depth': 1.0, 'niter': 500},
+]
+STATE_FILE = 'recovery_state.json'
+
+# Wall time growth of a slow run whose NITER does not go up, since slow runs
+# are often killed at the wall time rather than stopped at NITER
+SLOW_WALLTIME_FACTOR = 1.5
+
+# Files in kgrn/ that are outputs rather than the input of a job
+KGRN_OUTPUT_EXTS = {'.prn', '.pot', '.chd', '.fcd', '.tmp', '.log'}
+
+CONVERGED = re.compile(r'converged in\s+\d+\s+iter', re.IGNORECASE)
+NOT_CONVERGED = re.compile(r'not\s+converged', re.IGNORECASE)
+ERREN = re.compile(r'erren\s*=?\s*([-+]?\d*\.\d+(?:[EeDd][-+]?\d+)?)', re.IGNORECASE)
+
+
+def classify_kgrn(prn_path, window=20):
+    """
+    Classify the result of a KGRN run from its output file.
+    :param prn_path: Path to the KGRN .prn output
+    :param window: Number of last iterations used to detect oscillation
+    :return: 'converged', 'oscillating', 'slow' (not converged but still
+             improving), 'crashed' (output ends without a verdict) or 'missing'
+    """
+    if not os.path.exists(prn_path):
+        return 'missing'
+    with open(prn_path, 'r', errors='replace') as f:
+        text = f.read()
+    if NOT_CONVERGED.search(text) is None and CONVERGED.search(text):
+        return 'converged'
+
+    errors = [abs(float(e.replace('D', 'E').replace('d', 'e'))) for e in ERREN.findall(text)][-window:]
+    if len(errors) >= 3:
+        rises = sum(1 for a, b in zip(errors, errors[1:]) if b > a)
+        if rises / (len(errors) - 1) > 0.4:
+            return 'oscillating'
+    if NOT_CONVERGED.search(text) or errors:
+        return 'slow'
+    return 'crashed'
+
+
+def find_kgrn_input(folder, job):
+    """Find the KGRN input file of a job in folder/kgrn."""
+    kgrn_dir = os.path.join(folder, 'kgrn')
+    with os.scandir(kgrn_dir) as entries:
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            if stem == job and ext not in KGRN_OUTPUT_EXTS and entry.is_file():
+                with open(entry.path, 'r') as f:
+                    if 'AMIX=' in f.read():
+                        return entry.path
+    return None
+
+
+def find_potential(folder, job):
+    """Find the potential written by a previous KGRN run of a job, None if there is none."""
+    for path in [os.path.join(folder, 'kgrn', f'{job}.pot'), os.path.join(folder, 'kgrn', 'pot', f'{job}.pot')]:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _format_like(value, old, width):
+    if isinstance(value, str):
+        text = value
+    elif isinstance(value, int):
+        text = str(value)
+    elif '.' in old and old.replace('.', '').lstrip('-').isdigit():
+        text = f'{value:.{len(old.split(".")[1])}f}'
+    else:
+        text = f'{value:.4f}'
+    return text.rjust(width)
+
+
+def read_kgrn_keyword(path, key):
+    """Read the value of a keyword of a KGRN input file, None if it is not there."""
+    with open(path, 'r') as f:
+        match = re.search(r'(?<![A-Z])' + key.upper() + r'=\s*(\S+)', f.read())
+    return match.group(1) if match else None
+
+
+def update_kgrn_input(path, overrides):
+    """
+    Set keywords of a KGRN input file in place, keeping the fixed-width layout.
+    :param path: Path to the KGRN input file
+    :param overrides: Dictionary of keyword -> value, e.g. {'amix': 0.005}
+    """
+    with open(path, 'r') as f:
+        text = f.read()
+    for key, value in overrides.items():
+        pattern = re.compile(r'(?<![A-Z])(' + key.upper() + r'=)(\s*)(\S+)')
+        match = pattern.search(text)
+        if match is None:
+            raise ValueError(f"Keyword {key.upper()} not found in {path}.")
+        old = match.group(3)
+        width = len(match.group(2)) + len(old)
+        new = _format_like(value, old, width)
+        text = text[:match.start()] + match.group(1) + new + text[match.end():]
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def load_state(filename=STATE_FILE):
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def save_state(state, filename=STATE_FILE):
+    with open(filename, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+
+def recover_job(folder, job, state_file=STATE_FILE):
+    """
+    Prepare a failed KGRN job for resubmission with the next ladder step.
+    Oscillating runs skip the first step, which only lowers amix, and runs
+    without a potential to restart from start from scratch. Missing and
+    crashed runs show no convergence problem and are resubmitted unchanged.
+    When NITER goes up, or the run was slow, the wall time of the job
+    script is extended with it.
+    :param folder: Folder of the calculation, containing kgrn/ and kfcd/
+    :param job: Job name, e.g. 'TiVNbTa_d1_0.01_3.050000'
+    :return: True if the job should be resubmitted
+    """
+    failure = classify_kgrn(os.path.join(folder, 'kgrn', f'{job}.prn'))
+    if failure == 'converged':
+        print(f"KGRN job {job} converged, resubmitting it unchanged")
+        return True
+    if failure in ('missing', 'crashed'):
+        print(f"KGRN job {job} is {failure}, resubmitting it unchanged")
+        return True
+
+    state = load_state(state_file)
+    level = state.get(job, 0)
+    if failure == 'oscillating':
+        level = max(level, 1)
+    if level >= len(RECOVERY_LADDER):
+        print(f"KGRN job {job} is {failure} and the recovery ladder is exhausted")
+        return False
+
+    input_path = find_kgrn_input(folder, job)
+    if input_path is None:
+        print(f"KGRN input of job {job} not found, resubmitting it unchanged")
+        return True
+    overrides = dict(RECOVERY_LADDER[level])
+    if find_potential(folder, job) is None:
+        overrides['strt'] = 'A'
+    old_niter = read_kgrn_keyword(input_path, 'niter')
+    update_kgrn_input(input_path, overrides)
+    state[job] = level + 1
+    save_state(state, state_file)
+    settings = ', '.join(f'{key}={value}' for key, value in overrides.items())
+    print(f"KGRN job {job} is {failure}, resubmitting with {settings}")
+
+    factor = 1.0
+    if 'niter' in overrides and old_niter is not None and old_niter.isdigit():
+        factor = overrides['niter'] / int(old_niter)
+    if failure == 'slow':
+        factor = max(factor, SLOW_WALLTIME_FACTOR)
+    script = os.path.join(folder, f'{job}.sh')
+    if factor > 1 and os.path.exists(script):
+        runtime = extend_walltime(script, factor)
+        if runtime is not None:
+            print(f"Wall time of {job}.sh raised to {runtime}")
+    return True
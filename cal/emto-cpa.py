@@ -5,36 +5,29 @@ import subprocess
 import time
 import sys
 import csv
+from archive_outputs import archive_alloy
+from slurm_planner import plan_job, record_job_history, apply_plan
+from output_watcher import check_outputs, missing_outputs, wait_for_outputs
+from convergence_recovery import recover_job, RECOVERY_LADDER
+from input_templates import get_template, write_jobs
+from campaign_files import set_status, MANIFEST_FILE
+from pyemto.utilities import distort
+from emto_parameters import (primitive, sofc, xc, method, prims0, basis0, sws_range, deltas,
+                             distortions, LATTICE_KMESH, ELASTIC_KMESH, LATTICE_PARAMS, ELASTIC_PARAMS)
 
 # local parameters
 BMDL_DIR = '/public/home/jcc/structures/fcc/bmdl'
 KSTR_DIR = '/public/home/jcc/structures/fcc/kstr'
 SHAPE_DIR = '/public/home/jcc/structures/fcc/shape'
+# Campaign folder holding alloy_concentrations.txt, data.csv and the campaign manifest
+datadir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'alloy_input_generation')
+manifest_file = os.path.join(datadir, MANIFEST_FILE)
 
-# sh parameters
-partition = 'pms'
-nodes = 1
-ncpu = 32
-runtime = '24:00:00'
-
-# cal parameters
-primitive = 'bcc'
+# cal parameters, shared settings are in emto_parameters.py
 species = [['Ti', 'V','Nb','Ta']]
 concs = [[0.25, 0.25,0.25,0.25]]
-# splts = [[1, -1]]  
-sofc = 'Y'
-find_primitive = False
-make_supercell = None
-coords_are_cartesian = True
-
-# EOS parameters
-xc = 'PBE'
-method = 'morse'
-units = 'bohr'
 
-nkx = 41
-nky = 41
-nkz = 41
+nkx, nky, nkz = LATTICE_KMESH
 
 # Function to get job status
 def get_job_status(job_ids):
@@ -49,53 +42,66 @@ def get_job_status(job_ids):
         job_status[current_job_id] = current_job_status
     return job_status
 
-# Function to check job completion
-def check_job_completion(job_ids):
-    """Checks if all jobs are completed."""
-    while True:
-        time.sleep(5)
-        job_status = get_job_status(job_ids)
-        all_completed = True
-        has_job_queuing = False
-        for current_job_id, current_job_status in job_status.items():
-            if current_job_status == "R":  # Running
-                print(f"Job {current_job_id} is running...")
-                all_completed = False
-            elif current_job_status == "CF":  # Configuring
-                print(f"Job {current_job_id} is configuring...")
-                all_completed = False
-            elif current_job_status == "PD":  # Pending
-                print(f"Job {current_job_id} is pending...")
-                all_completed = False
-                has_job_queuing = True
-            elif current_job_status == "CG":  # Completed
-                print(f"{primitive} job {current_job_id} has completed")
-            else:
-                print(f"Job {current_job_id} status is {current_job_status}")
-                all_completed = False
-
-        if all_completed:
-            print("All jobs completed!")
+# Function to wait for jobs
+def wait_for_jobs(job_ids, expected):
+    """Waits for jobs by watching their output files instead of polling squeue.
+    squeue is only asked on each wake-up whether the jobs have left the queue,
+    which also ends the wait for jobs that fail without writing their outputs."""
+    while job_ids:
+        missing = wait_for_outputs(expected, timeout=120, poll=15)
+        queued = [current_job_id for current_job_id, current_job_status in get_job_status(job_ids).items()
+                  if current_job_status != "CG"]
+        if not queued:
             break
-        elif has_job_queuing:
-            print("Jobs are queuing, waiting 2 minutes before checking again...")
-            time.sleep(115)
+        if missing:
+            print(f"{len(queued)} jobs queued or running, "
+                  f"{sum(len(names) for names in missing.values())} output files missing...")
+        else:
+            # All outputs exist, give the jobs time to finish writing them
+            time.sleep(5)
+    print("All jobs completed!")
+
+# Function to update the campaign manifest
+def update_manifest(status):
+    """Sets the status of this alloy in the campaign manifest kept next to data.csv."""
+    set_status(species[0], concs[0], status, manifest_file)
+
+# Function to submit job scripts
+def submit_scripts(scripts):
+    """Submits job scripts with sbatch and returns a dictionary of script -> job ID."""
+    job_ids = {}
+    for script in scripts:
+        result = subprocess.run(["sbatch", script], stdout=subprocess.PIPE)
+        out = result.stdout.decode().strip()
+        if out.startswith("Submitted batch job"):
+            job_ids[script] = out.split()[-1]
         else:
-            time.sleep(15)  # Check every 20 seconds if jobs are running
-            print("Jobs are running, waiting 20 seconds before checking again...")
+            print(f"Submitting {script} failed")
+    return job_ids
 
 # Function to check if output files exist
-def check_files(folder_name, file_name):
-    """Checks if the specified file exists in the folder."""
-    if not os.path.exists(f"{folder_name}") or not os.path.isdir(f"{folder_name}"):
-        print(f"Error: Subfolder {folder_name} does not exist in the current directory.")
-        sys.exit(1)
-
-    shape_path = os.path.join(f"{folder_name}", f"{file_name}")
-    if os.path.exists(shape_path):
-        print(f"{folder_name}/{file_name} exists. Job completed successfully.")
-    else:
-        print(f"Job exited abnormally: Output file {file_name} not found.")
+def check_files(expected, script_for, recover=False):
+    """Checks all expected output files and resubmits only the jobs whose outputs are missing.
+    With recover=True failed KGRN jobs are resubmitted with escalating mixing parameters."""
+    rounds = len(RECOVERY_LADDER) if recover else 1
+    for _ in range(rounds):
+        missing = check_outputs(expected)
+        if not missing:
+            return
+        scripts = set()
+        for names in missing.values():
+            for name in names:
+                if recover and not recover_job(os.getcwd(), os.path.splitext(name)[0]):
+                    continue
+                scripts.add(script_for(name))
+        if not scripts:
+            break
+        print(f"Resubmitting {len(scripts)} jobs...")
+        job_ids = list(submit_scripts(sorted(scripts)).values())
+        wait_for_jobs(job_ids, expected)
+    if check_outputs(expected):
+        print("Output files are still missing after resubmission.")
+        update_manifest('failed')
         sys.exit(1)
 
 # Function to define input parameters
@@ -148,41 +154,15 @@ def write_to_csv(data, filename, headers):
         writer.writerow(data)
 
 
-# Primitive bcc
-if primitive == 'bcc':
-    prims0 = np.array([
-        [0.5, 0.5, -0.5],
-        [0.5, -0.5, 0.5],
-        [-0.5, 0.5, 0.5]])
-# Primitive fcc
-if primitive == 'fcc':
-    prims0 = np.array([
-        [0.5, 0.5, 0],
-        [0.5, 0, 0.5],
-        [0, 0.5, 0.5]])
-
-
-basis0 = np.array([
-    [0.0, 0.0, 0.0]
-])
-
 folder = os.getcwd()
+alloy_dir = folder
 emtopath = folder
 latpath = emtopath
 
 
-slurm_options = [f'#SBATCH -n {ncpu}',
-                 f'#SBATCH --nodes={nodes}',
-                 f'#SBATCH --partition={partition}'
-                 ]
-
-
-deltas = np.linspace(0, 0.05, 6)
-# We need to use a non-zero value for the first delta to break the symmetry of the structure.
-deltas[0] = 0.001
+# Choose partition, ncpu and wall time from queue state and past run times
+plan = plan_job('lattice', (nkx, nky, nkz))
 
-# Only two distortions for cubic (third one is bulk modulus EOS fit)
-distortions = ['Cprime', 'C44']
 
 jobname = ''
 for i in range(len(species)):
@@ -190,53 +170,15 @@ for i in range(len(species)):
         jobname += "{}".format(species[i][j])
 print("Generating lattice constant input files...")
 while True:
-    # Redirect output to buffer
-    sys.stdout = StringIO()
-
-    # Calculate equilibrium volume
-    for i, distortion in enumerate(distortions):
-
-        if i > 0:
-            pass
-
-        input_creator = EMTO(folder=emtopath, EMTOdir=emtodir)
-        input_creator.prepare_input_files(latpath=latpath,
-                                          jobname=jobname,
-                                          species=species,
-                                          # afm =afm,
-                                          # splts=splts,
-                                          concs=concs,
-                                          prims=prims0,
-                                          basis=basis0,
-                                          find_primitive=find_primitive,
-                                          coords_are_cartesian=coords_are_cartesian,
-                                          latname=primitive,
-                                          nz1=32,
-                                          ncpa=10,
-                                          sofc=sofc,
-                                          nkx=nkx,
-                                          nky=nky,
-                                          nkz=nkz,
-                                          ncpu=ncpu,
-                                          parallel=False,
-                                          alpcpa=0.9,
-                                          runtime=runtime,
-                                          KGRN_file_type='scf',
-                                          KFCD_file_type='fcd',
-                                          amix=0.01,
-                                          # efgs=-1.0,
-                                          depth=0.75,
-                                          tole=1e-5,
-                                          tolef=1e-5,
-                                          iex=4,
-                                          niter=100,
-                                          kgrn_nfi=31,
-                                          # strt='B',
-                                          make_supercell=make_supercell,
-                                          slurm_options=slurm_options)
-        input_creator.write_kgrn_kfcd_swsrange(sws=sws_range)
-# Close buffer
-sys.stdout = open(1, 'w', closefd=False)
+    # Calculate equilibrium volume.
+    # Inputs already written for the campaign by input_templates.py are kept.
+    if missing_outputs({emtopath: [f'{jobname}_{sws:.6f}.sh' for sws in sws_range]}):
+        template = get_template(species[0], prims0, basis0, primitive, LATTICE_PARAMS)
+        write_jobs([(template, emtopath, jobname, concs[0], sws, (nkx, nky, nkz)) for sws in sws_range])
+    for sws in sws_range:
+        apply_plan(f'{jobname}_{sws:.6f}.sh', plan)
+    # The structure script is written with the KGRN options, size it for kstr/shape/bmdl
+    apply_plan(f'{primitive}.sh', plan_job('structure'))
 print("Lattice constant files generated!")
 
 # Submit lattice job and save job ID
@@ -251,9 +193,11 @@ print(primitive, " structure job submitted, ID is:", job_id[0])
 
 # Call functions to check job completion and file existence
 print("Checking structure job status...")
-check_job_completion(job_id)
+expected = {"shape": [f"{primitive}.shp"]}
+wait_for_jobs(job_id, expected)
+record_job_history(job_id, 'structure')
 print("Checking structure job output files...")
-check_files("shape", f"{primitive}.shp")
+check_files(expected, lambda name: f"{primitive}.sh")
 
 # Write EOS script file into a sh file
 print("Submitting lattice constant jobs...")
@@ -272,13 +216,15 @@ for line in proc.stdout:
     if out.startswith("Submitted batch job"):
         job_id = out.split()[-1]
         job_ids.append(job_id)
+update_manifest('submitted')
 
 # Call functions to check job completion and file existence
 print("Checking lattice constant job status...")
-check_job_completion(job_ids)
+expected = {"kfcd": [f"{jobname}_{sws_range[i]:.6f}.prn" for i in range(len(sws_range))]}
+wait_for_jobs(job_ids, expected)
+record_job_history(job_ids, 'lattice', LATTICE_KMESH)
 print("Checking lattice constant output files...")
-for i in range(len(sws_range)):
-    check_files("kfcd", f"{jobname}_{sws_range[i]:.6f}.prn")
+check_files(expected, lambda name: name.replace('.prn', '.sh'), recover=True)
 
 # Call function to get input parameters
 print("Analyzing lattice constants...")
@@ -308,6 +254,7 @@ r_squared = float(r_squared[3])
 print(f"Variance of EOS fitting curve is {r_squared:.8f} ")
 if r_squared < 0.9:
     print("EOS curve fitting is too poor, it is recommended to reselect the WS radius for calculation")
+    update_manifest('failed')
     sys.exit()
 # Get the WS radius with the lowest energy
 sws0 = extract_parameters('lattice_constants.txt', 'sws0')
@@ -368,9 +315,10 @@ folder = os.getcwd()  # Get current directory
 latpath = folder  # CPA structure output file location
 emtopath = folder  # EMTO calculation output file location
 
-# Redirect output to buffer
-sys.stdout = StringIO()
+elastic_jobs = []
 for i, distortion in enumerate(distortions):
+    nkx, nky, nkz = ELASTIC_KMESH[distortion]
+
     for delta in deltas:
         # These distortion matrices are from the EMTO book.
 
@@ -392,58 +340,19 @@ for i, distortion in enumerate(distortions):
         prims = distort(dist_matrix, prims0)
         basis = distort(dist_matrix, basis0)
 
-        # Each different distortion might need different set of nkx, nky, nkz
-        if distortion == 'Cprime':
-            nkx = 41;
-            nky = 41;
-            nkz = 41
-        elif distortion == 'C44':
-            nkx = 40;
-            nky = 40;
-            nkz = 45
-
-        input_creator = EMTO(folder=emtopath, EMTOdir=emtodir)
-        input_creator.prepare_input_files(latpath=latpath,
-                                          jobname=f'{jobname}_d{i + 1}_{delta:4.2f}',
-                                          species=species,
-                                          # afm=afm,
-                                          # splts=splts,
-                                          concs=concs,
-                                          prims=prims,
-                                          basis=basis,
-                                          find_primitive=find_primitive,
-                                          coords_are_cartesian=coords_are_cartesian,
-                                          latname='d{0}_{1:4.2f}'.format(i + 1, delta),
-                                          # nz1=32,
-                                          ncpa=15,
-                                          sofc=sofc,
-                                          nkx=nkx,
-                                          nky=nky,
-                                          nkz=nkz,
-                                          ncpu=ncpu,
-                                          parallel=False,
-                                          alpcpa=0.8,
-                                          runtime=runtime,
-                                          KGRN_file_type='scf',
-                                          KFCD_file_type='fcd',
-                                          amix=0.01,
-                                          #efgs=-1.0,
-                                          depth=0.7,
-                                          tole=1e-5,
-                                          tolef=1e-5,
-                                          iex=4,
-                                          niter=200,
-                                          kgrn_nfi=91,
-                                          #strt='B',
-                                          make_supercell=make_supercell,
-                                          slurm_options=slurm_options)
-        
+        # Only sws, concs, jobname and the k-mesh change between alloys of a family
+        latname = 'd{0}_{1:4.2f}'.format(i + 1, delta)
+        template = get_template(species[0], prims, basis, latname, ELASTIC_PARAMS)
+        elastic_jobs.append((template, emtopath, f'{jobname}_d{i + 1}_{delta:4.2f}', concs[0],
+                             sws_range[0], (nkx, nky, nkz)))
 
-        input_creator.write_kgrn_kfcd_swsrange(sws=sws_range)
-        
-        output = sys.stdout.getvalue()
-    
-sys.stdout = open(1, 'w', closefd=False)
+write_jobs(elastic_jobs)
+structure_plan = plan_job('structure')
+for i, distortion in enumerate(distortions):
+    plan = plan_job('elastic', ELASTIC_KMESH[distortion])
+    for delta in deltas:
+        apply_plan(f'd{i+1}_{delta:4.2f}.sh', structure_plan)
+        apply_plan(f'{jobname}_d{i+1}_{delta:4.2f}_{sws_range[0]:.6f}.sh', plan)
 
 with open('sbatch_lat.sh', 'w') as f:
     f.writelines('#!/bin/bash\n')
@@ -468,32 +377,28 @@ for line in proc.stdout:
         job_ids.append(job_id)
         
 
-check_job_completion(job_ids)  
+expected = {"shape": [f'd{i+1}_{delta:4.2f}.shp' for i in range(len(distortions)) for delta in deltas]}
+wait_for_jobs(job_ids, expected)
+record_job_history(job_ids, 'structure')
 
-for i, distortion in enumerate(distortions):
-    for delta in deltas:                    
-        check_files("shape",f'd{i+1}_{delta:4.2f}.shp')
+check_files(expected, lambda name: name.replace('.shp', '.sh'))
 
 
-cmd = ["bash", "sbatch_ela.sh"]
-proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-        
-
-job_ids = []
-for line in proc.stdout:
-    out = line.decode().strip()
-    if out.startswith("Submitted batch job"):
-        job_id = out.split()[-1]
-        job_ids.append(job_id)
+# Submit per script so the run time of each job is recorded with its own k-mesh
+ela_scripts = {distortion: [f'{jobname}_d{i+1}_{delta:4.2f}_{sws_range[0]:.6f}.sh' for delta in deltas]
+               for i, distortion in enumerate(distortions)}
+submitted = submit_scripts([script for scripts in ela_scripts.values() for script in scripts])
+job_ids = list(submitted.values())
 
+expected = {"kfcd": [f'{jobname}_d{i+1}_{delta:4.2f}_{sws_range[0]:.6f}.prn'
+                     for i in range(len(distortions)) for delta in deltas]}
+wait_for_jobs(job_ids, expected)
+for distortion, scripts in ela_scripts.items():
+    record_job_history([submitted[script] for script in scripts if script in submitted],
+                       'elastic', ELASTIC_KMESH[distortion])
 
 
-check_job_completion(job_ids) 
-
-
-for i, distortion in enumerate(distortions):
-    for delta in deltas:
-        check_files("kfcd",f'{jobname}_d{i+1}_{delta:4.2f}_{sws_range[0]:.6f}.prn')
+check_files(expected, lambda name: name.replace('.prn', '.sh'), recover=True)
         
 j=0
 k=0
@@ -574,4 +479,8 @@ finally:
     data.extend([f'{i}' for i in concs[0]])
     data.extend([f'{r_squared:.6f}',f'{sws0:.6f}',f'{lattice_constants:.6f}',f'{E0}',f'{c11}',f'{c12}',
         f'{c44}',f'{BH}',f'{GH}',f'{EH}',f'{vH}',f'{AVR}'])
-    write_to_csv(data, 'data.csv',headers)
\ No newline at end of file
+    write_to_csv(data, 'data.csv',headers)
+    update_manifest('completed')
+
+    # Pack the finished alloy into one archive to spare scratch inodes
+    archive_alloy(alloy_dir)
\ No newline at end of file
@@ -0,0 +1,86 @@
+import numpy as np
+
+# cal parameters
+primitive = 'bcc'
+# splts = [[1, -1]]
+sofc = 'Y'
+find_primitive = False
+make_supercell = None
+coords_are_cartesian = True
+
+# EOS parameters
+xc = 'PBE'
+method = 'morse'
+units = 'bohr'
+
+# Primitive bcc
+if primitive == 'bcc':
+    prims0 = np.array([
+        [0.5, 0.5, -0.5],
+        [0.5, -0.5, 0.5],
+        [-0.5, 0.5, 0.5]])
+# Primitive fcc
+if primitive == 'fcc':
+    prims0 = np.array([
+        [0.5, 0.5, 0],
+        [0.5, 0, 0.5],
+        [0, 0.5, 0.5]])
+
+basis0 = np.array([
+    [0.0, 0.0, 0.0]
+])
+
+# WS radii of the first lattice constant round
+sws_range = np.linspace(3.00, 3.20, 5)
+
+deltas = np.linspace(0, 0.05, 6)
+# We need to use a non-zero value for the first delta to break the symmetry of the structure.
+deltas[0] = 0.001
+
+# Only two distortions for cubic (third one is bulk modulus EOS fit)
+distortions = ['Cprime', 'C44']
+
+# Each different distortion might need different set of nkx, nky, nkz
+LATTICE_KMESH = (41, 41, 41)
+ELASTIC_KMESH = {'Cprime': (41, 41, 41), 'C44': (40, 40, 45)}
+
+# KGRN/KFCD settings passed to pyemto's prepare_input_files.
+# ncpu, runtime and slurm_options come from slurm_planner at submit time.
+LATTICE_PARAMS = dict(find_primitive=find_primitive,
+                      coords_are_cartesian=coords_are_cartesian,
+                      nz1=32,
+                      ncpa=10,
+                      sofc=sofc,
+                      parallel=False,
+                      alpcpa=0.9,
+                      KGRN_file_type='scf',
+                      KFCD_file_type='fcd',
+                      amix=0.01,
+                      # efgs=-1.0,
+                      depth=0.75,
+                      tole=1e-5,
+                      tolef=1e-5,
+                      iex=4,
+                      niter=100,
+                      kgrn_nfi=31,
+                      # strt='B',
+                      make_supercell=make_supercell)
+
+ELASTIC_PARAMS = dict(find_primitive=find_primitive,
+                      coords_are_cartesian=coords_are_cartesian,
+                      ncpa=15,
+                      sofc=sofc,
+                      parallel=False,
+                      alpcpa=0.8,
+                      KGRN_file_type='scf',
+                      KFCD_file_type='fcd',
+                      amix=0.01,
+                      # efgs=-1.0,
+                      depth=0.7,
+                      tole=1e-5,
+                      tolef=1e-5,
+                      iex=4,
+                      niter=200,
+                      kgrn_nfi=91,
+                      # strt='B',
+                      make_supercell=make_supercell)
@@ -1,5 +1,7 @@
 import os
 import re
+import sys
+from campaign_files import read_concentration_sets
 
 def read_combinations(filename):
     """Read the alloy combinations from the specified file."""
@@ -47,7 +49,18 @@ def main():
     # Define path to the files
     combinations_file = os.path.join('alloy_input_generation', 'alloy_combinations.txt')
     concentrations_file = os.path.join('alloy_input_generation', 'alloy_concentrations.txt')
-    
+
+    # A selection written by active_learning.py holds several sets per combination,
+    # read as one (combination, concentrations) pair per set
+    if len(sys.argv) > 1:
+        selection_file = sys.argv[1]
+        entries = read_concentration_sets(selection_file)
+        species = [list(combo) for combo, _ in entries]
+        concs = [concentration_set for _, concentration_set in entries]
+        print(f"Using {len(concs)} selected concentration sets from {selection_file}.")
+        update_emto_parameters(species, concs)
+        return
+
     # Read combinations and concentrations
     species = read_combinations(combinations_file)
     concs = read_concentrations(concentrations_file)
@@ -55,7 +68,7 @@ def main():
     # Check if we have the right number of combinations and concentrations
     if len(species) != 126:
         print(f"Warning: Expected 126 combinations, but found {len(species)}.")
-    
+
     if len(concs) != 126 * 36:  # Expecting 36 concentrations for each of the 126 combinations
         print(f"Warning: Expected {126 * 36} concentrations, but found {len(concs)}.")
 
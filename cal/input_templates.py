@@ -0,0 +1,250 @@
+import os
+import io
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import contextlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pyemto.emto_input_generator import EMTO
+from emto_parameters import primitive, prims0, basis0, sws_range, LATTICE_KMESH, LATTICE_PARAMS
+from slurm_planner import default_plan, slurm_options_for
+from campaign_files import read_concentration_sets
+
+# local parameters
+EMTODIR = '/public/home/jcc/EMTO'
+
+# Compiled templates are cached here and shared by every alloy of a combination
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+# Placeholder values used to locate the substituted fields in the reference files.
+# Two sets are rendered so that each compiled template can be checked against pyemto.
+# The check set uses 2-digit k-meshes like the real ones, so a field whose width
+# depends on the value does not pass the check.
+SENTINELS = [
+    {'jobname': 'TPLJOB', 'sws': 9.876543, 'kmesh': (173, 179, 181), 'step': 0.137},
+    {'jobname': 'ALTJOB', 'sws': 8.765432, 'kmesh': (43, 47, 53), 'step': 0.211},
+]
+
+# Templates are compiled with the default SBATCH settings; the plan of a stage
+# is applied to the rendered scripts with slurm_planner.apply_plan.
+TEMPLATE_PLAN = default_plan()
+
+NUMBER = re.compile(r'(?<![\w.])\d+\.\d+|(?<![\w.])\d+(?![\w.])|(?<=_)\d+\.\d+')
+
+
+def sentinel_concs(n, step):
+    """Distinct placeholder concentrations for n species that sum to one."""
+    weights = [1 + step * i for i in range(n)]
+    return [w / sum(weights) for w in weights]
+
+
+def write_reference_inputs(folder, jobname, species, concs, sws, kmesh, prims, basis, latname, params):
+    """Write one job with pyemto, exactly as emto-cpa.py does."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        input_creator = EMTO(folder=folder, EMTOdir=EMTODIR)
+        input_creator.prepare_input_files(latpath=folder,
+                                          jobname=jobname,
+                                          species=[list(species)],
+                                          concs=[list(concs)],
+                                          prims=prims,
+                                          basis=basis,
+                                          latname=latname,
+                                          nkx=kmesh[0],
+                                          nky=kmesh[1],
+                                          nkz=kmesh[2],
+                                          **params)
+        input_creator.write_kgrn_kfcd_swsrange(sws=[sws])
+
+
+def _compile_text(text, values):
+    """Split text into literal strings and (field, decimals, width) placeholders."""
+    strings = [(values['folder'], 'folder'), (values['jobname'], 'jobname')]
+    floats = [(values['sws'], 'sws')] + [(c, f'conc{i}') for i, c in enumerate(values['concs'])]
+    ints = {str(k): name for k, name in zip(values['kmesh'], ('nkx', 'nky', 'nkz'))}
+    pattern = '|'.join(re.escape(s) for s, _ in strings) + '|' + NUMBER.pattern
+
+    parts = []
+    found = set()
+    last = 0
+    for match in re.finditer(pattern, text):
+        token = match.group(0)
+        field = None
+        for s, name in strings:
+            if token == s:
+                field = (name, None, None)
+        if field is None and '.' in token:
+            decimals = len(token.split('.')[1])
+            if decimals >= 3:
+                for value, name in floats:
+                    if abs(float(token) - value) <= 0.5 * 10 ** -decimals + 1e-12:
+                        field = (name, decimals, len(token))
+        elif field is None and token in ints:
+            field = (ints[token], 0, len(token))
+        if field is None:
+            continue
+        parts.append(text[last:match.start()])
+        parts.append(field)
+        found.add(field[0])
+        last = match.end()
+    parts.append(text[last:])
+    return parts, found
+
+
+def _render_parts(parts, values):
+    out = []
+    for part in parts:
+        if isinstance(part, str):
+            out.append(part)
+            continue
+        name, decimals, width = part
+        if decimals is None:
+            out.append(values[name])
+        elif decimals == 0:
+            out.append(str(values[name]).rjust(width))
+        else:
+            out.append(f'{values[name]:.{decimals}f}'.rjust(width))
+    return ''.join(out)
+
+
+def _field_values(folder, jobname, concs, sws, kmesh):
+    values = {'folder': folder, 'jobname': jobname, 'sws': sws,
+              'nkx': kmesh[0], 'nky': kmesh[1], 'nkz': kmesh[2]}
+    values.update({f'conc{i}': c for i, c in enumerate(concs)})
+    return values
+
+
+def _read_tree(folder):
+    files = {}
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'r') as f:
+                files[os.path.relpath(path, folder)] = f.read()
+    return files
+
+
+def compile_template(species, prims, basis, latname, params):
+    """
+    Compile the input files of one parameter family into a template.
+    A family shares species, structure and EMTO parameters; jobname, concs,
+    sws and the k-mesh are substituted at render time.
+    The template is rendered with a second set of values and compared
+    against pyemto, so a field that cannot be substituted raises ValueError.
+    """
+    references = []
+    for sentinel in SENTINELS:
+        folder = tempfile.mkdtemp(prefix='emto_tpl_')
+        try:
+            concs = sentinel_concs(len(species), sentinel['step'])
+            write_reference_inputs(folder, sentinel['jobname'], species, concs, sentinel['sws'],
+                                   sentinel['kmesh'], prims, basis, latname, params)
+            values = dict(sentinel, folder=folder, concs=concs)
+            references.append((values, _read_tree(folder)))
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    (values, files), (check_values, check_files) = references
+    template = []
+    found = set()
+    for relpath, text in sorted(files.items()):
+        path_parts, path_found = _compile_text(relpath, values)
+        text_parts, text_found = _compile_text(text, values)
+        template.append((path_parts, text_parts))
+        found |= path_found | text_found
+    for name in ['jobname', 'sws'] + [f'conc{i}' for i in range(len(species))]:
+        if name not in found:
+            raise ValueError(f"Could not locate {name} in the {latname} reference inputs.")
+
+    check = _field_values(check_values['folder'], check_values['jobname'], check_values['concs'],
+                          check_values['sws'], check_values['kmesh'])
+    rendered = {_render_parts(p, check): _render_parts(t, check) for p, t in template}
+    if rendered != check_files:
+        mismatched = sorted(set(rendered.items()) ^ set(check_files.items()))
+        raise ValueError(f"Template for {latname} does not reproduce pyemto output: {mismatched[0][0]}")
+    return template
+
+
+def get_template(species, prims, basis, latname, params, template_dir=TEMPLATE_DIR):
+    """
+    Load the template of a parameter family from the cache, compiling it on first use.
+    :param params: pyemto settings of the family, without ncpu, runtime and slurm_options
+    """
+    key = json.dumps([list(species), latname, np.asarray(prims).tolist(), np.asarray(basis).tolist(), params],
+                     sort_keys=True, default=str)
+    path = os.path.join(template_dir, hashlib.sha1(key.encode()).hexdigest() + '.json')
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    params = dict(params, ncpu=TEMPLATE_PLAN['ncpu'], runtime=TEMPLATE_PLAN['runtime'],
+                  slurm_options=slurm_options_for(TEMPLATE_PLAN))
+    template = compile_template(species, prims, basis, latname, params)
+    # Several drivers may compile the same family at once, each through its own file
+    os.makedirs(template_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=template_dir)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(template, f)
+    os.replace(tmp_path, path)
+    return template
+
+
+def render_job(template, folder, jobname, concs, sws, kmesh):
+    """Return the (path, text) pairs of one job rendered from a template."""
+    values = _field_values(folder, jobname, concs, sws, kmesh)
+    return [(os.path.join(folder, _render_parts(p, values)), _render_parts(t, values))
+            for p, t in template]
+
+
+def _write_file(item):
+    path, text = item
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def write_jobs(jobs, max_workers=16):
+    """
+    Render and write jobs in bulk through a thread pool.
+    :param jobs: Iterable of (template, folder, jobname, concs, sws, kmesh)
+    :return: Number of files written
+    """
+    # Structure files are shared by every volume of a job, keep one copy per path
+    files = {}
+    for job in jobs:
+        files.update(render_job(*job))
+    for directory in {os.path.dirname(path) for path in files}:
+        os.makedirs(directory, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for _ in pool.map(_write_file, files.items(), chunksize=64):
+            pass
+    return len(files)
+
+
+def main():
+    # Only the lattice stage is rendered up front: the elastic inputs need sws0
+    # from the EOS fit and are rendered by emto-cpa.py with get_template/write_jobs.
+    # Run emto-cpa.py inside each alloy folder; it keeps the inputs written here
+    # and applies the plan of the lattice stage to the scripts at submit time.
+    concentrations_file = os.path.join('alloy_input_generation', 'alloy_concentrations.txt')
+    emtopath = os.path.join(os.getcwd(), 'campaign')
+
+    entries = read_concentration_sets(concentrations_file)
+    templates = {}
+    jobs = []
+    for n, (combo, concs) in enumerate(entries):
+        jobname = ''.join(combo)
+        folder = os.path.join(emtopath, f'{jobname}_{n:04d}')
+        if combo not in templates:
+            templates[combo] = get_template(combo, prims0, basis0, primitive, LATTICE_PARAMS)
+        fractions = [c / sum(concs) for c in concs]
+        for sws in sws_range:
+            jobs.append((templates[combo], folder, jobname, fractions, sws, LATTICE_KMESH))
+
+    print(f"Loaded {len(templates)} templates for {len(entries)} alloys.")
+    count = write_jobs(jobs)
+    print(f"{count} input files have been written to {emtopath}")
+
+
+if __name__ == '__main__':
+    main()
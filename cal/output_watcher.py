@@ -0,0 +1,106 @@
+import os
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+# Shared filesystems where inotify does not see writes from other nodes
+NETWORK_FILESYSTEMS = {'lustre', 'nfs', 'nfs4', 'gpfs', 'beegfs', 'cifs', 'smb3', 'fuse.sshfs'}
+
+
+def get_fs_type(path):
+    """Gets the filesystem type of a path from /proc/mounts."""
+    path = os.path.realpath(path)
+    best, fs_type = '', None
+    try:
+        with open('/proc/mounts') as f:
+            for line in f:
+                fields = line.split()
+                mount_point = fields[1]
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) \
+                        and len(mount_point) > len(best):
+                    best, fs_type = mount_point, fields[2]
+    except OSError:
+        pass
+    return fs_type
+
+
+def snapshot(folder):
+    """Lists the file names of a folder with one scandir call, None if it does not exist."""
+    try:
+        with os.scandir(folder) as entries:
+            return {entry.name for entry in entries}
+    except FileNotFoundError:
+        return None
+
+
+def missing_outputs(expected):
+    """
+    Compare the expected output files with one snapshot per folder.
+    :param expected: Dictionary of folder -> list of expected file names
+    :return: Dictionary of folder -> sorted list of missing file names
+    """
+    missing = {}
+    for folder, names in expected.items():
+        present = snapshot(folder) or set()
+        absent = sorted(set(names) - present)
+        if absent:
+            missing[folder] = absent
+    return missing
+
+
+def check_outputs(expected):
+    """Checks all expected output files at once and reports every missing one."""
+    missing = missing_outputs(expected)
+    total = sum(len(names) for names in expected.values())
+    if not missing:
+        print(f"All {total} output files exist. Jobs completed successfully.")
+        return missing
+    for folder, names in missing.items():
+        for name in names:
+            print(f"Job exited abnormally: Output file {folder}/{name} not found.")
+    print(f"{sum(len(names) for names in missing.values())} of {total} output files are missing.")
+    return missing
+
+
+def _use_inotify(folders):
+    if INotify is None:
+        return False
+    for folder in folders:
+        if not os.path.isdir(folder) or get_fs_type(folder) in NETWORK_FILESYSTEMS:
+            return False
+    return True
+
+
+def wait_for_outputs(expected, timeout=None, poll=30):
+    """
+    Wait until all expected output files exist or the timeout expires.
+    Uses inotify on local filesystems and a scandir snapshot per folder and
+    poll interval on Lustre/NFS, where inotify misses writes from compute nodes.
+    :param expected: Dictionary of folder -> list of expected file names
+    :param timeout: Seconds to wait, None to wait forever
+    :param poll: Seconds between snapshots, also the inotify read timeout
+    :return: Dictionary of folder -> sorted list of files still missing
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    missing = missing_outputs(expected)
+    if not missing:
+        return missing
+
+    if _use_inotify(expected):
+        with INotify() as inotify:
+            for folder in expected:
+                inotify.add_watch(folder, flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE)
+            # Check again in case files appeared before the watches were set
+            missing = missing_outputs(expected)
+            while missing and (deadline is None or time.time() < deadline):
+                inotify.read(timeout=poll * 1000)
+                missing = missing_outputs(expected)
+        return missing
+
+    while missing and (deadline is None or time.time() < deadline):
+        time.sleep(poll)
+        missing = missing_outputs(expected)
+    return missing
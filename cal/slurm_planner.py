@@ -0,0 +1,275 @@
+import os
+import csv
+import math
+import fcntl
+import subprocess
+import tempfile
+from datetime import datetime
+
+# Partitions we may submit to, in order of preference on a tie
+PARTITIONS = ['pms']
+nodes = 1
+default_ncpu = 32
+default_runtime = '24:00:00'
+
+# Sizing parameters
+min_ncpu = 8
+ncpu_step = 8
+target_seconds = 4 * 3600      # Prefer the smallest ncpu that finishes within this time
+safety_factor = 1.5            # Margin on top of the historical 90th percentile
+walltime_step = 600            # Round wall time up to 10 minutes
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'job_history.csv')
+HISTORY_HEADERS = ['stage', 'nkx', 'nky', 'nkz', 'ncpu', 'elapsed']
+
+
+def seconds_to_walltime(seconds):
+    """Format seconds as a SLURM wall time, e.g. 5400 -> '01:30:00'."""
+    seconds = int(seconds)
+    return f'{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}'
+
+
+def walltime_to_seconds(walltime):
+    """Parse a SLURM time limit ('D-HH:MM:SS', 'HH:MM:SS', 'MM:SS' or 'infinite')."""
+    if walltime in ('infinite', 'UNLIMITED', ''):
+        return None
+    days = 0
+    if '-' in walltime:
+        days, walltime = walltime.split('-')
+        days = int(days)
+    fields = [int(x) for x in walltime.split(':')]
+    while len(fields) < 3:
+        fields.insert(0, 0)
+    return days * 86400 + fields[0] * 3600 + fields[1] * 60 + fields[2]
+
+
+def get_partition_info(partition):
+    """Gets the time limit, CPUs per node and idle CPUs of a partition using sinfo."""
+    cmd = ["sinfo", "-h", "-p", partition, "-o", "%l %c %C"]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
+    except OSError:
+        return None
+    lines = result.stdout.strip().split("\n")
+    if result.returncode != 0 or not lines[0]:
+        return None
+    time_limit, cpus_per_node, cpu_states = lines[0].split()
+    allocated, idle, other, total = [int(x) for x in cpu_states.split('/')]
+    return {'time_limit': walltime_to_seconds(time_limit),
+            'cpus_per_node': int(cpus_per_node.rstrip('+')),
+            'idle_cpus': idle}
+
+
+def get_pending_jobs(partition):
+    """Counts the pending jobs of a partition using squeue."""
+    cmd = ["squeue", "-h", "-p", partition, "-t", "PD", "-o", "%i"]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
+    except OSError:
+        return 0
+    return len([line for line in result.stdout.split("\n") if line.strip()])
+
+
+def expected_start_delay(partition, ncpu, walltime, info):
+    """
+    Estimate the seconds until a job would start in a partition.
+    Uses the scheduler's own estimate from sbatch --test-only, and falls back
+    to the idle CPUs and queue length reported by sinfo/squeue.
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.sh', delete=False) as f:
+        f.write('#!/bin/bash\ntrue\n')
+        script = f.name
+    try:
+        cmd = ["sbatch", "--test-only", f"--partition={partition}", f"--nodes={nodes}",
+               "-n", str(ncpu), "-t", walltime, script]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
+        output = result.stdout + result.stderr
+    except OSError:
+        output = ''
+    finally:
+        os.remove(script)
+
+    # sbatch: Job 123 to start at 2024-05-01T10:00:00 using 32 processors on nodes cn01 in partition pms
+    if 'to start at' in output:
+        start = output.split('to start at')[1].split()[0]
+        try:
+            delay = (datetime.strptime(start, '%Y-%m-%dT%H:%M:%S') - datetime.now()).total_seconds()
+            return max(delay, 0.0)
+        except ValueError:
+            pass
+
+    if info['idle_cpus'] >= ncpu:
+        return 0.0
+    return (get_pending_jobs(partition) + 1) * walltime_to_seconds(walltime)
+
+
+def read_history(stage, kmesh=None, filename=HISTORY_FILE):
+    """
+    Get the historical CPU time (seconds x ncpu) of completed jobs.
+    Jobs of the same stage and k-mesh are used when available, otherwise all
+    jobs of the stage scaled by the number of k-points. Stages without a
+    k-mesh, such as 'structure', use all jobs of the stage.
+    """
+    if not os.path.exists(filename):
+        return []
+    exact, scaled = [], []
+    with open(filename, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            if row['stage'] != stage:
+                continue
+            cpu_seconds = float(row['elapsed']) * int(row['ncpu'])
+            if kmesh is None:
+                exact.append(cpu_seconds)
+                continue
+            kpoints = kmesh[0] * kmesh[1] * kmesh[2]
+            row_kmesh = (int(row['nkx']), int(row['nky']), int(row['nkz']))
+            if row_kmesh == tuple(kmesh):
+                exact.append(cpu_seconds)
+            scaled.append(cpu_seconds * kpoints / (row_kmesh[0] * row_kmesh[1] * row_kmesh[2]))
+    return exact or scaled
+
+
+def record_job_history(job_ids, stage, kmesh=None, filename=HISTORY_FILE):
+    """Appends the run time of completed jobs, read with sacct, to the history file."""
+    if not job_ids:
+        return
+    cmd = ["sacct", "-n", "-P", "-X", "-j", ",".join(job_ids), "-o", "JobID,State,ElapsedRaw,NCPUS"]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
+    except OSError:
+        print("sacct is not available, job run times are not recorded")
+        return
+    kmesh = kmesh or ('', '', '')
+    with open(filename, 'a', newline='') as f:
+        # Many drivers append at once; the lock also keeps the header check atomic
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0, os.SEEK_END)
+        writer = csv.writer(f)
+        if f.tell() == 0:
+            writer.writerow(HISTORY_HEADERS)
+        for line in result.stdout.strip().split("\n"):
+            if not line:
+                continue
+            job_id, state, elapsed, job_ncpu = line.split('|')
+            if state == 'COMPLETED':
+                writer.writerow([stage, kmesh[0], kmesh[1], kmesh[2], job_ncpu, elapsed])
+
+
+def size_job(cpu_samples, cpus_per_node, time_limit):
+    """
+    Choose ncpu and wall time from historical CPU times.
+    Returns the smallest ncpu whose padded run time fits target_seconds, or the
+    full node if none does, with the wall time clamped to the partition limit.
+    """
+    if not cpu_samples:
+        return default_ncpu, default_runtime
+    samples = sorted(cpu_samples)
+    cpu_seconds = samples[min(len(samples) - 1, int(math.ceil(0.9 * len(samples))) - 1)] * safety_factor
+
+    max_ncpu = max(min_ncpu, cpus_per_node)
+    ncpu = max_ncpu
+    for candidate in range(min_ncpu, max_ncpu + 1, ncpu_step):
+        if cpu_seconds / candidate <= target_seconds:
+            ncpu = candidate
+            break
+    seconds = math.ceil(cpu_seconds / ncpu / walltime_step) * walltime_step
+    if time_limit is not None:
+        seconds = min(seconds, time_limit)
+    return ncpu, seconds_to_walltime(seconds)
+
+
+def default_plan():
+    """Plan with the configured defaults, used when no partition can be queried."""
+    return {'partition': PARTITIONS[0], 'nodes': nodes, 'ncpu': default_ncpu, 'runtime': default_runtime}
+
+
+def plan_job(stage, kmesh=None):
+    """
+    Choose partition, ncpu and wall time for a job of a stage and k-mesh.
+    :param stage: Name of the workflow stage, e.g. 'structure', 'lattice' or 'elastic'
+    :param kmesh: (nkx, nky, nkz) of the job, None for the structure stage
+    :return: Dictionary with partition, nodes, ncpu and runtime
+    """
+    cpu_samples = read_history(stage, kmesh)
+    best = None
+    for partition in PARTITIONS:
+        info = get_partition_info(partition)
+        if info is None:
+            print(f"Partition {partition} is not available, skipping it")
+            continue
+        ncpu, runtime = size_job(cpu_samples, info['cpus_per_node'], info['time_limit'])
+        delay = expected_start_delay(partition, ncpu, runtime, info)
+        print(f"Partition {partition}: {ncpu} CPUs for {runtime}, expected start in {delay / 60:.0f} min")
+        if best is None or delay < best[0]:
+            best = (delay, partition, ncpu, runtime)
+
+    if best is None:
+        return default_plan()
+    delay, partition, ncpu, runtime = best
+    return {'partition': partition, 'nodes': nodes, 'ncpu': ncpu, 'runtime': runtime}
+
+
+def slurm_options_for(plan):
+    """SBATCH lines for a plan, in the form used by emto-cpa.py."""
+    return [f'#SBATCH -n {plan["ncpu"]}',
+            f'#SBATCH --nodes={plan["nodes"]}',
+            f'#SBATCH --partition={plan["partition"]}'
+            ]
+
+
+def apply_plan(script, plan):
+    """
+    Rewrite the ncpu, partition and wall time lines of a written job script.
+    pyemto writes the structure script (kstr/shape/bmdl) with the SBATCH options
+    of the KGRN jobs, so it is resized with the plan of the 'structure' stage.
+    """
+    with open(script, 'r') as f:
+        lines = f.read().split('\n')
+    for i, line in enumerate(lines):
+        fields = line.split()
+        if len(fields) < 2 or fields[0] != '#SBATCH':
+            continue
+        option = fields[1]
+        if option == '-n' or option.startswith('--ntasks'):
+            lines[i] = f'#SBATCH -n {plan["ncpu"]}'
+        elif option == '-p' or option.startswith('--partition'):
+            lines[i] = f'#SBATCH --partition={plan["partition"]}'
+        elif option == '-t' or option.startswith('--time'):
+            lines[i] = f'#SBATCH -t {plan["runtime"]}'
+    with open(script, 'w') as f:
+        f.write('\n'.join(lines))
+
+
+def extend_walltime(script, factor):
+    """
+    Scale the wall time of a written job script, e.g. when a resubmitted job
+    runs more iterations. The wall time is rounded up to walltime_step and
+    kept within the time limit of the script's partition.
+    :return: The new wall time, None if the script has no wall time line
+    """
+    with open(script, 'r') as f:
+        lines = f.read().split('\n')
+    partition, time_line = None, None
+    for i, line in enumerate(lines):
+        fields = line.split()
+        if len(fields) < 2 or fields[0] != '#SBATCH':
+            continue
+        option = fields[1]
+        if option == '-p' or option.startswith('--partition'):
+            partition = fields[-1].split('=')[-1]
+        elif option == '-t' or option.startswith('--time'):
+            time_line = i
+    if time_line is None:
+        return None
+    seconds = walltime_to_seconds(lines[time_line].split()[-1].split('=')[-1])
+    if seconds is None:
+        return None
+    seconds = math.ceil(seconds * factor / walltime_step) * walltime_step
+    info = get_partition_info(partition) if partition else None
+    if info is not None and info['time_limit'] is not None:
+        seconds = min(seconds, info['time_limit'])
+    runtime = seconds_to_walltime(seconds)
+    lines[time_line] = f'#SBATCH -t {runtime}'
+    with open(script, 'w') as f:
+        f.write('\n'.join(lines))
+    return runtime